@@ -10,16 +10,30 @@ order to guarantee consistent refresh, power management (turn on) and timeout
 reset.
 """
 
-from functools import wraps
-from time import time
-from typing import Any, Callable, List, Optional
+import logging
+import threading
+from functools import partial, wraps
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Callable, FrozenSet, Optional
 
+from coffee.app.db import Database
 from coffee.app.page import HomePage, MugPage, Page
-from coffee.config import MUG_BUTTON_LOOKBEHIND_DURATION, DEFAULT_LCD_TIMEOUT
-from coffee.io.encoder import Encoder
+from coffee.config import (
+    DEFAULT_LCD_TIMEOUT,
+    ENCODER_COALESCE_COUNT,
+    ENCODER_COALESCE_DELAY,
+    MUG_BUTTON_LOOKBEHIND_DURATION,
+)
 from coffee.io.lcd import LCD
-from coffee.io.multiplex import Multiplex
-from coffee.io.scale import Scale
+
+if TYPE_CHECKING:
+    # Only needed for annotations: these pull in the GPIO / I2C / HX711 libraries,
+    # the actual instances are built by the caller and given to `set_inputs`
+    from coffee.io.encoder import Encoder
+    from coffee.io.multiplex import Multiplex
+    from coffee.io.scale import Scale
+
+logger = logging.getLogger(__name__)
 
 
 def set_page(func: Callable[..., Optional[Page]]) -> Callable[..., Optional[Page]]:
@@ -30,20 +44,32 @@ def set_page(func: Callable[..., Optional[Page]]) -> Callable[..., Optional[Page
     logic to:
 
     1. Attach the LCD reference to the newly returned page
-    2. Turn the LCD on (it may have been turned off after a timeout)
-    3. Trigger a display refresh
+    2. Turn the LCD on (stopping any running animation) on page transitions,
+       or if it was turned off after a timeout
+    3. Trigger a display refresh (deferred while a temporary message, see
+       `Page.display_temporary`, is still due on screen)
     4. Update the last interaction timestamp
+
+    The screen is never cleared: pages are expected to overwrite their own
+    content on redraw. When the callback stays on the current page, it is only
+    redrawn if the callback flagged it as ``dirty``.
     """
 
     @wraps(func)
     def wrapper(self: "LCDApp", *args: Any, **kwargs: Any) -> Optional[Page]:
+        # A new event replaces any temporary message still displayed
+        self.cancel_redraw()
         page = func(self, *args, **kwargs)
         if page is not None:
-            self.page = page.set_lcd(self.lcd)
-        self.lcd.turn_on()
-        self.page.display()
-        self.last_update = int(time())
-        self.has_timed_out = False
+            self.page = page.set_lcd(self.lcd, self.db)
+            self.page_timeout = self.get_page_timeout(self.page)
+            self.on_home_page = isinstance(self.page, HomePage)
+        redraw = page is not None or not self.lcd.is_on or self.page.dirty
+        if page is not None or not self.lcd.is_on:
+            self.lcd.turn_on()
+        if redraw:
+            self.redraw()
+        self.reset_timeout()
         return page
 
     return wrapper
@@ -69,6 +95,7 @@ class LCDApp:
         width: int = 16,
         page: Optional[Page] = None,
         timeout: int = DEFAULT_LCD_TIMEOUT,
+        db: Optional[Database] = None,
     ) -> None:
         """Initialize the LCD application.
 
@@ -85,24 +112,37 @@ class LCDApp:
         timeout:
             Global inactivity timeout (seconds) used when a page does not
             define its own ``timeout`` attribute.
+        db:
+            Database shared by all the pages (defaults to a new `Database`).
         """
         self.lcd = LCD(1, address, rows, width)
-        self.page = page if page is not None else HomePage().set_lcd(self.lcd)
+        self.db = db if db is not None else Database()
+        self.page = (page if page is not None else HomePage()).set_lcd(self.lcd, self.db)
 
         self.timeout = timeout
-        self.last_update = int(time())
-        self.has_timed_out = False
+        self.page_timeout = self.get_page_timeout(self.page)
+        self.on_home_page = isinstance(self.page, HomePage)
+        self.reset_timeout()
         self.is_on = True
 
-        self.scale: Scale | None = None
-        self.multiplex: Multiplex | None = None
-        self.encoder: Encoder | None = None
+        self.scale: "Scale | None" = None
+        self.multiplex: "Multiplex | None" = None
+        self.encoder: "Encoder | None" = None
+
+        # Pending (not yet forwarded) rotary encoder ticks
+        self._encoder_lock = threading.Lock()
+        self._encoder_delta = 0
+        self._encoder_ticks = 0
+        self._encoder_timer: Optional[threading.Timer] = None
+
+        # Redraw waiting for a temporary message to be shown long enough
+        self._redraw_timer: Optional[threading.Timer] = None
 
     def set_inputs(
         self,
-        scale: Scale | None = None,
-        multiplex: Multiplex | None = None,
-        encoder: Encoder | None = None,
+        scale: "Scale | None" = None,
+        multiplex: "Multiplex | None" = None,
+        encoder: "Encoder | None" = None,
     ) -> None:
         """Configure optional hardware input devices.
 
@@ -126,30 +166,73 @@ class LCDApp:
 
         if multiplex is not None:
             self.multiplex = multiplex
-            self.multiplex.set_button_callback(self.person_button_callback)
+            self.multiplex.set_button_callback(
+                partial(self.dispatch, "person_button_callback")
+            )
 
         if encoder is not None:
             self.encoder = encoder
             self.encoder.set_encoder_callback(self.encoder_callback)
-            self.encoder.set_encoder_button_callback(self.encoder_button_callback)
-            self.encoder.set_red_button_callback(self.red_button_callback)
+            self.encoder.set_encoder_button_callback(
+                partial(self.dispatch, "encoder_button_callback")
+            )
+            self.encoder.set_red_button_callback(
+                partial(self.dispatch, "red_button_callback")
+            )
 
     def display(self) -> None:
         """Refresh the LCD with the current page content."""
-        self.lcd.clear()
         self.page.display()
 
+    def redraw(self) -> None:
+        """Display the current page, or schedule it if the LCD is on hold.
+
+        The LCD is on hold while a temporary message must stay on screen: the
+        redraw then runs from a timer once the message has been shown for its
+        whole duration, instead of blocking the calling thread.
+        """
+        delay = self.lcd.hold_until - monotonic()
+        if delay > 0:
+            self._redraw_timer = threading.Timer(delay, self.redraw)
+            self._redraw_timer.daemon = True
+            self._redraw_timer.start()
+            return
+        self._redraw_timer = None
+        self.page.display()
+        self.page.dirty = False
+
+    def cancel_redraw(self) -> None:
+        """Release the LCD hold, and cancel any scheduled redraw."""
+        self.lcd.hold_until = 0.0
+        if self._redraw_timer is not None:
+            self._redraw_timer.cancel()
+            self._redraw_timer = None
+
+    def get_page_timeout(self, page: Page) -> int:
+        """Return the inactivity timeout (seconds) applying to a page.
+
+        If the page defines a ``timeout`` attribute it's used; otherwise the
+        application-wide default timeout is applied. This is computed once per
+        page transition (see `set_page`) and stored in ``page_timeout``.
+        """
+        # Pages may optionally define a "timeout" attribute (in seconds)
+        return getattr(page, "timeout", None) or self.timeout
+
+    def reset_timeout(self) -> None:
+        """Record an interaction and schedule the next timeout deadline."""
+        self.last_update = monotonic()
+        self.timeout_deadline = self.last_update + self.page_timeout
+        self.has_timed_out = False
+
     def check_timeout(self) -> None:
         """Check page timeout and revert to base page / power-saving mode.
 
-        If the active page defines a ``timeout`` attribute it's used;
-        otherwise the application-wide default timeout is applied.
+        This is called on every tick of the main loop, so it only compares the
+        current time against the deadline computed by `reset_timeout`.
         """
-        # Pages may optionally define a "timeout" attribute (in seconds)
-        timeout: int = getattr(self.page, "timeout", self.timeout) or self.timeout
-        if (not self.has_timed_out) and int(time()) - self.last_update >= timeout:
-            was_home_page = isinstance(self.page, HomePage)
-            self.timeout_callback()
+        if (not self.has_timed_out) and monotonic() >= self.timeout_deadline:
+            was_home_page = self.on_home_page
+            self.dispatch("timeout_callback")
             if was_home_page:
                 # Timeout on home page = turn off screen
                 self.lcd.turn_off()
@@ -164,47 +247,62 @@ class LCDApp:
             #   self.page.display()
 
     @set_page
-    def timeout_callback(self) -> Optional[Page]:
-        print("Timeout")
-        return self.page.timeout_callback()
+    def dispatch(self, callback_name: str, *args: Any) -> Optional[Page]:
+        """Forward an input event to the callback of the same name on the current page.
 
-    @set_page
-    def encoder_callback(self, clockwise: bool) -> Optional[Page]:
-        """Rotary encoder rotation event.
+        Input devices are bound to this method through `functools.partial` (see
+        `set_inputs`), e.g. a person button press calls
+        ``dispatch("person_button_callback", button_id)``.
 
         Parameters
         ----------
-        clockwise:
-            ``True`` if the physical rotation is clockwise, else counterclockwise.
+        callback_name:
+            Name of the `Page` callback method, e.g. ``"red_button_callback"``.
+        args:
+            Arguments of the event (e.g. the pressed ``button_id``).
         """
-        print(f"Encoder - Clockwise {clockwise} - Page {self.page.__class__.__name__}")
-        return self.page.encoder_callback(clockwise)
-
-    @set_page
-    def encoder_button_callback(self) -> Optional[Page]:
-        """Rotary encoder push button event."""
-        print(f"Encoder button - Page {self.page.__class__.__name__}")
-        return self.page.encoder_button_callback()
+        logger.debug(
+            "%s%s - Page %s", callback_name, args, self.page.__class__.__name__
+        )
+        return getattr(self.page, callback_name)(*args)
 
-    @set_page
-    def red_button_callback(self) -> Optional[Page]:
-        """Red (cancel) button event."""
-        print(f"Red button - Page {self.page.__class__.__name__}")
-        return self.page.red_button_callback()
+    def encoder_callback(self, clockwise: bool) -> None:
+        """Rotary encoder rotation event.
 
-    @set_page
-    def person_button_callback(self, button_id: int) -> Optional[Page]:
-        """Person button event.
+        Ticks are not forwarded to the page one by one: they are accumulated
+        and flushed (see `flush_encoder`) after ``ENCODER_COALESCE_COUNT``
+        ticks or ``ENCODER_COALESCE_DELAY`` seconds, whichever comes first.
 
         Parameters
         ----------
-        button_id:
-            Zero-based index of the pressed person button.
+        clockwise:
+            ``True`` if the physical rotation is clockwise, else counterclockwise.
         """
-        print(
-            f"Person button callback - ID {button_id} - Page {self.page.__class__.__name__}"
-        )
-        return self.page.person_button_callback(button_id)
+        with self._encoder_lock:
+            self._encoder_delta += 1 if clockwise else -1
+            self._encoder_ticks += 1
+            flush = self._encoder_ticks >= ENCODER_COALESCE_COUNT
+            if not flush and self._encoder_timer is None:
+                self._encoder_timer = threading.Timer(
+                    ENCODER_COALESCE_DELAY, self.flush_encoder
+                )
+                self._encoder_timer.daemon = True
+                self._encoder_timer.start()
+        if flush:
+            self.flush_encoder()
+
+    def flush_encoder(self) -> None:
+        """Forward the pending rotary encoder ticks to the current page."""
+        with self._encoder_lock:
+            delta = self._encoder_delta
+            self._encoder_delta = 0
+            self._encoder_ticks = 0
+            if self._encoder_timer is not None:
+                self._encoder_timer.cancel()
+                self._encoder_timer = None
+        # Ticks that cancel out (jitter, back and forth) are not a turn
+        if delta:
+            self.dispatch("encoder_callback", delta)
 
     @set_page
     def served_mug_callback(self, mug_value: float) -> Optional[Page]:
@@ -215,22 +313,19 @@ class LCDApp:
         mug_value:
             Mug weight in grams reported by the scale.
         """
-        print(f"New mug - {mug_value} g")
-        recent_button_presses: List[int] = []
+        logger.info("New mug - %s g", mug_value)
+        recent_button_presses: FrozenSet[int] = frozenset()
         if MUG_BUTTON_LOOKBEHIND_DURATION and self.multiplex is not None:
             # Gather button presses that occurred within the look-behind window
-            now = time()
-            recent_button_presses = [
-                person_id
-                for person_id, timestamp in self.multiplex.state.items()
-                if now - timestamp < MUG_BUTTON_LOOKBEHIND_DURATION
-            ]
+            recent_button_presses = self.multiplex.get_recent_button_ids(
+                MUG_BUTTON_LOOKBEHIND_DURATION
+            )
             if recent_button_presses:
-                print(f"Including: {recent_button_presses}")
+                logger.info("Including: %s", recent_button_presses)
         return MugPage(mug_value=mug_value, person_ids=recent_button_presses)
 
     @set_page
     def removed_pot_callback(self) -> Optional[Page]:
         """Pot removed event (start of serving workflow)."""
-        print("Pot removed")
+        logger.info("Pot removed")
         return MugPage()
@@ -1,6 +1,96 @@
 import sqlite3
-from datetime import datetime
-from typing import List, Union
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+# Queries run on every UI event. They are built once, so that the exact same
+# strings hit the statement cache of the connection (see `cached_statements`).
+_SQL_ADD_USER = (
+    "INSERT INTO user (button_id, name, creation_dt, creation_epoch) VALUES (?, ?, ?, ?)"
+)
+_SQL_ADD_MUG = "INSERT INTO mug (button_id, value, mug_dt, mug_epoch) VALUES (?, ?, ?, ?)"
+# Mug queries take the button_ids to look up (see `_in_query`): names are resolved
+# to button_ids beforehand (see `Database.get_button_ids`), rather than joining on user
+_SQL_GET_MUGS = (
+    "SELECT button_id, value, mug_dt, mug_epoch FROM mug WHERE button_id IN ({})"
+)
+# Half-open range between local midnights, using the (button_id, mug_epoch) index
+_SQL_TODAY_FILTER = " AND mug_epoch >= ? AND mug_epoch < ?"
+_SQL_GET_TODAY_STATS = (
+    """
+    SELECT COUNT(*), COALESCE(SUM(value), 0)
+    FROM mug
+    WHERE button_id IN ({})
+"""
+    + _SQL_TODAY_FILTER
+)
+_SQL_GET_BUTTON_IDS = "SELECT DISTINCT button_id FROM user WHERE name = ?"
+# Walks the (button_id, creation_epoch) index backwards (the rowid, last in the
+# index, breaks ties between names given within the same second)
+_SQL_GET_NAME = """
+    SELECT name
+    FROM user
+    WHERE button_id = ?
+    ORDER BY creation_epoch DESC, rowid DESC
+    LIMIT 1
+"""
+# Batched `_SQL_GET_NAME` (see `_in_query`), oldest first in index order
+_SQL_GET_NAMES = """
+    SELECT button_id, name
+    FROM user
+    WHERE button_id IN ({})
+    ORDER BY button_id, creation_epoch, rowid
+"""
+_SQL_GET_SUM = "SELECT COUNT(*), SUM(value) FROM mug"
+
+# Schema, run as a single script when the shared connection is opened
+_SQL_SCHEMA = """
+    BEGIN;
+
+    CREATE TABLE IF NOT EXISTS user (
+        button_id INTEGER,
+        name TEXT,
+        creation_dt TEXT,
+        creation_epoch INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS mug (
+        button_id INTEGER,
+        value REAL,
+        mug_dt TEXT,
+        mug_epoch INTEGER
+    );
+
+    -- Per-person mug lookups, filtered on the (Unix epoch) datetime
+    CREATE INDEX IF NOT EXISTS idx_mug_button_epoch ON mug (button_id, mug_epoch);
+
+    -- Name lookups: latest name of a button, and buttons of a name
+    CREATE INDEX IF NOT EXISTS idx_user_button_epoch ON user (button_id, creation_epoch);
+    CREATE INDEX IF NOT EXISTS idx_user_name ON user (name);
+
+    COMMIT;
+"""
+
+
+@lru_cache(maxsize=None)
+def _in_query(template: str, n: int, today: bool = False) -> str:
+    """Fill the IN clause of a query template with `n` placeholders (once per size)."""
+    query = template.format(", ".join("?" * n))
+    return query + _SQL_TODAY_FILTER if today else query
+
+
+def parse_dt(row: sqlite3.Row) -> datetime:
+    """Parse the datetime of a mug row returned by `Database.get_mugs`."""
+    return datetime.fromtimestamp(row["mug_epoch"])
+
+
+def today_bounds() -> Tuple[int, int]:
+    """Return the Unix timestamps of today's and tomorrow's local midnights."""
+    start = datetime.combine(date.today(), time())
+    return int(start.timestamp()), int((start + timedelta(days=1)).timestamp())
 
 
 class Database:
@@ -8,8 +98,32 @@ class Database:
     SQLite database interface for the coffee tracking application.
 
     Manages user data and coffee consumption records using a context manager pattern.
+    The underlying connection is opened (and the schema created) on first use, then
+    shared by every `Database` instance pointing to the same file: entering the
+    context manager only borrows it, and it stays open until `close` is called.
     """
 
+    # Shared connections, by database file
+    _connections: Dict[str, sqlite3.Connection] = {}
+    # Cursor of each shared connection, reused by the queries rather than creating
+    # one per call (results are always fetched right away)
+    _cursors: Dict[str, sqlite3.Cursor] = {}
+    # Serializes the use of the shared connections across threads
+    _lock = threading.RLock()
+    # Number of inserted rows after which they are committed (1 = commit on each insert).
+    # Pending rows are visible through the shared connection and committed on `close`.
+    flush_every: int = 1
+    # Number of inserted rows not committed yet, by database file
+    _pending: Dict[str, int] = {}
+    # Whether inserts are currently grouped by `batched` (commits are then deferred)
+    _batching: bool = False
+    # Names returned by `get_name`, by (database file, button_id), least recent first
+    _name_cache: "OrderedDict[Tuple[str, int], Union[str, int]]" = OrderedDict()
+    # Maximum number of cached names
+    name_cache_size: int = 256
+    # Button ids returned by `get_button_ids`, by (database file, name)
+    _button_ids_cache: Dict[Tuple[str, str], Tuple[int, ...]] = {}
+
     def __init__(self, db_name: str = "app_data.db"):
         """
         Initialize database connection parameters.
@@ -19,133 +133,261 @@ class Database:
         """
         self.db_name = db_name
         self.conn = None  # Will be initialized in __enter__
+        self.cursor = None
+        # The same instance can be shared (e.g. by the app pages) and re-entered
+        self._depth = 0
 
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_name)
-        self.create_tables()
+        self._lock.acquire()
+        if self._depth:
+            self._depth += 1
+            return self
+        try:
+            self.conn = self._connections.get(self.db_name)
+            if self.conn is None:
+                self.conn = sqlite3.connect(
+                    self.db_name, check_same_thread=False, cached_statements=256
+                )
+                self.conn.row_factory = sqlite3.Row
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                # 8 MB page cache (negative values are in KiB)
+                self.conn.execute("PRAGMA cache_size=-8000")
+                self.conn.execute("PRAGMA temp_store=MEMORY")
+                self.create_tables()
+                self._connections[self.db_name] = self.conn
+                self._cursors[self.db_name] = self.conn.cursor()
+            self.cursor = self._cursors[self.db_name]
+        except BaseException:
+            self.conn = None
+            self._lock.release()
+            raise
+        self._depth = 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.conn:
-            self.conn.close()
+        self._depth -= 1
+        if not self._depth:
+            # The connection is kept open for the next use
             self.conn = None
+            self.cursor = None
+        self._lock.release()
 
     def create_tables(self):
-        """Create tables if they don't exist."""
-        cursor = self.conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user (
-                button_id INTEGER,
-                name TEXT,
-                creation_dt TEXT
-            )
-        """)
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS mug (
-                button_id INTEGER,
-                value REAL,
-                mug_dt TEXT
-            )
-        """)
-
-        self.conn.commit()
+        """Create tables and indexes if they don't exist (once per shared connection)."""
+        # Older databases only stored the ISO formatted (local) datetimes: add the
+        # epoch columns before the schema indexes them (new tables already have them)
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(mug)")]
+        if columns and "mug_epoch" not in columns:
+            self.conn.execute("ALTER TABLE mug ADD COLUMN mug_epoch INTEGER")
+            self.conn.execute("""
+                UPDATE mug SET mug_epoch = CAST(strftime('%s', mug_dt, 'utc') AS INTEGER)
+            """)
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(user)")]
+        if columns and "creation_epoch" not in columns:
+            self.conn.execute("ALTER TABLE user ADD COLUMN creation_epoch INTEGER")
+            self.conn.execute("""
+                UPDATE user
+                SET creation_epoch = CAST(strftime('%s', creation_dt, 'utc') AS INTEGER)
+            """)
+
+        # Commits the migration above, then runs the whole DDL in one transaction
+        self.conn.executescript(_SQL_SCHEMA)
 
     def add_user(self, button_id: int, name: str, dt: datetime = None):
         """Insert a user record."""
         dt = dt or datetime.now()
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO user (button_id, name, creation_dt)
-            VALUES (?, ?, ?)
-        """,
-            (button_id, name, dt.isoformat()),
+        self._name_cache.pop((self.db_name, button_id), None)
+        self._button_ids_cache.pop((self.db_name, name), None)
+        self.cursor.execute(
+            _SQL_ADD_USER, (button_id, name, dt.isoformat(), int(dt.timestamp()))
         )
-        self.conn.commit()
+        self.commit(1)
 
     def add_mug(self, button_id: int, value: float, dt: datetime = None):
         """Insert a mug record."""
         dt = dt or datetime.now()
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO mug (button_id, value, mug_dt)
-            VALUES (?, ?, ?)
-        """,
-            (button_id, value, dt.isoformat()),
+        self.cursor.execute(
+            _SQL_ADD_MUG, (button_id, value, dt.isoformat(), int(dt.timestamp()))
+        )
+        self.commit(1)
+
+    def add_mugs(self, mugs: Iterable[Tuple[int, float]], dt: datetime = None):
+        """Insert several (button_id, value) mug records at once, sharing the same datetime."""
+        dt = dt or datetime.now()
+        dt_str, epoch = dt.isoformat(), int(dt.timestamp())
+        self.cursor.executemany(
+            _SQL_ADD_MUG,
+            [(button_id, value, dt_str, epoch) for button_id, value in mugs],
         )
-        self.conn.commit()
+        self.commit(self.cursor.rowcount)
+
+    def import_users(self, users: Iterable[Tuple[int, str, datetime]]):
+        """Insert (button_id, name, datetime) user records (e.g. a backup) in one transaction."""
+        rows = [
+            (button_id, name, dt.isoformat(), int(dt.timestamp()))
+            for button_id, name, dt in users
+        ]
+        with self.batched():
+            for button_id, name, _, _ in rows:
+                self._name_cache.pop((self.db_name, button_id), None)
+                self._button_ids_cache.pop((self.db_name, name), None)
+            self.cursor.executemany(_SQL_ADD_USER, rows)
 
-    def get_mugs(self, identifier: Union[int, str], today: bool = True) -> List[dict]:
+    def import_mugs(self, mugs: Iterable[Tuple[int, float, datetime]]):
+        """Insert (button_id, value, datetime) mug records (e.g. a backup) in one transaction."""
+        rows = [
+            (button_id, value, dt.isoformat(), int(dt.timestamp()))
+            for button_id, value, dt in mugs
+        ]
+        with self.batched():
+            self.cursor.executemany(_SQL_ADD_MUG, rows)
+
+    def commit(self, n_rows: int = 0):
         """
-        Get all mugs corresponding to a button_id or user name.
-        Returns a list of dictionaries with parsed datetimes.
+        Account for `n_rows` newly inserted rows, and commit once at least
+        `flush_every` rows are pending (always commits when `flush_every` <= 1).
         """
-        cursor = self.conn.cursor()
+        pending = self._pending.get(self.db_name, 0) + n_rows
+        if pending >= self.flush_every and not self._batching:
+            self.conn.commit()
+            pending = 0
+        self._pending[self.db_name] = pending
 
-        if isinstance(identifier, int):
-            query = "SELECT button_id, value, mug_dt FROM mug WHERE button_id = ?"
-            params = [identifier]
-
-        elif isinstance(identifier, str):
-            query = """
-                SELECT m.button_id, m.value, m.mug_dt
-                FROM mug m
-                JOIN user u ON m.button_id = u.button_id
-                WHERE u.name = ?
-            """
-            params = [identifier]
+    @contextmanager
+    def batched(self) -> Iterator["Database"]:
+        """
+        Group the inserts done within the block into a single transaction,
+        committed when leaving the block (or rolled back on error).
 
+        Usage:
+            with Database() as db, db.batched():
+                db.add_mug(...)
+                db.add_mug(...)
+        """
+        if not self.conn.in_transaction:
+            # Take the write lock upfront rather than on the first insert
+            self.conn.execute("BEGIN IMMEDIATE")
+        self._batching = True
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
         else:
-            raise ValueError("Identifier must be an int (button_id) or str (name).")
+            self.conn.commit()
+        finally:
+            self._batching = False
+            self._pending[self.db_name] = 0
 
-        if today:
-            query += " AND date(mug_dt) = date('now', 'localtime')"
+    def get_mugs(
+        self, identifier: Union[int, str], today: bool = True
+    ) -> List[sqlite3.Row]:
+        """
+        Get all mugs corresponding to a button_id or user name.
+        Returns a list of rows, with keys 'button_id', 'value', 'mug_dt' (ISO string)
+        and 'mug_epoch' (Unix timestamp, see `parse_dt` to get a datetime).
+        """
+        button_ids = self._get_identifier_button_ids(identifier)
+        if not button_ids:
+            return []
+        query = _in_query(_SQL_GET_MUGS, len(button_ids), today)
+        params = (*button_ids, *today_bounds()) if today else button_ids
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        return self.cursor.execute(query, params).fetchall()
 
-        result = []
-        for button_id, value, dt_str in rows:
-            result.append(
-                {
-                    "button_id": button_id,
-                    "value": value,
-                    "datetime": datetime.fromisoformat(dt_str),
-                }
-            )
+    def get_today_stats(self, identifier: Union[int, str]) -> Tuple[int, float]:
+        """
+        Return the number of mugs of the day and their total value, for a button_id
+        or user name. Aggregated by SQLite, instead of fetching the mugs as `get_mugs`.
+        """
+        button_ids = self._get_identifier_button_ids(identifier)
+        if not button_ids:
+            return 0, 0
+        query = _in_query(_SQL_GET_TODAY_STATS, len(button_ids))
+        params = (*button_ids, *today_bounds())
+        count, total = self.cursor.execute(query, params).fetchone()
+        return count, total
 
-        return result
+    def get_button_ids(self, name: str) -> Tuple[int, ...]:
+        """
+        Return the button_ids that were ever given a name.
+        Results are cached until a user is added with this name.
+        """
+        key = (self.db_name, name)
+        if key not in self._button_ids_cache:
+            rows = self.cursor.execute(_SQL_GET_BUTTON_IDS, (name,)).fetchall()
+            self._button_ids_cache[key] = tuple(row[0] for row in rows)
+        return self._button_ids_cache[key]
+
+    def _get_identifier_button_ids(
+        self, identifier: Union[int, str]
+    ) -> Tuple[int, ...]:
+        """Return the button_ids of a button_id or user name."""
+        if isinstance(identifier, int):
+            return (identifier,)
+        elif isinstance(identifier, str):
+            return self.get_button_ids(identifier)
+        raise ValueError("Identifier must be an int (button_id) or str (name).")
 
     def get_name(self, button_id: int) -> str | int:
         """
         Return the most recent name associated with a given button_id.
         Returns button_id if no user is found.
+        Results are cached until a user is added for this button_id.
         """
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            SELECT name
-            FROM user
-            WHERE button_id = ?
-            ORDER BY datetime(creation_dt) DESC
-            LIMIT 1
-        """,
-            (button_id,),
-        )
-        row = cursor.fetchone()
-        return row[0] if row else button_id
+        key = (self.db_name, button_id)
+        if key in self._name_cache:
+            self._name_cache.move_to_end(key)
+            return self._name_cache[key]
+
+        row = self.cursor.execute(_SQL_GET_NAME, (button_id,)).fetchone()
+        name = row[0] if row else button_id
+        self._cache_name(key, name)
+        return name
+
+    def get_names(self, button_ids: Iterable[int]) -> Dict[int, Union[str, int]]:
+        """
+        Batched version of `get_name`: return the most recent name of each given
+        button_id (or the button_id itself if no user is found), by button_id.
+        Only the ids missing from the cache are queried, in a single query.
+        """
+        button_ids = list(button_ids)
+        names = {}
+        missing = []
+        for button_id in button_ids:
+            key = (self.db_name, button_id)
+            if key in self._name_cache:
+                self._name_cache.move_to_end(key)
+                names[button_id] = self._name_cache[key]
+            else:
+                missing.append(button_id)
+
+        if missing:
+            query = _in_query(_SQL_GET_NAMES, len(missing))
+            rows = self.cursor.execute(query, missing).fetchall()
+            # In index order (no sort), oldest first: the most recent name wins, with
+            # the same tie-break as `get_name`
+            found = {row["button_id"]: row["name"] for row in rows}
+            for button_id in missing:
+                name = found.get(button_id, button_id)
+                self._cache_name((self.db_name, button_id), name)
+                names[button_id] = name
+
+        return {button_id: names[button_id] for button_id in button_ids}
+
+    def _cache_name(self, key: Tuple[str, int], name: Union[str, int]):
+        """Cache a name, evicting the least recently used one beyond `name_cache_size`."""
+        self._name_cache[key] = name
+        if len(self._name_cache) > self.name_cache_size:
+            self._name_cache.popitem(last=False)
 
     def get_sum(self) -> dict:
         """
         Return the total number of mugs and the sum of their values across all users.
         Returns a dict with keys: 'count' and 'sum'.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT COUNT(*), SUM(value) FROM mug")
-        row = cursor.fetchone()
+        row = self.cursor.execute(_SQL_GET_SUM).fetchone()
 
         return {
             "count": row[0] if row[0] is not None else 0,
@@ -153,5 +395,13 @@ class Database:
         }
 
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
+        """Close the shared database connection (e.g. on application shutdown)."""
+        with self._lock:
+            conn = self._connections.pop(self.db_name, None)
+            self._cursors.pop(self.db_name, None)
+            if conn is not None:
+                conn.commit()
+                conn.close()
+            self._pending.pop(self.db_name, None)
+            self.conn = None
+            self.cursor = None
@@ -8,48 +8,83 @@ from any callback method to trigger a navigation transition.
 
 import subprocess
 import time
-from datetime import datetime
-from typing import List, Optional
+from datetime import date
+from functools import partial
+from typing import Collection, Dict, Optional, Tuple, Union
 
-from coffee.config import CUSTOM_CHARS_IDX
+from coffee.config import CUSTOM_CHARS_IDX, STATS_CACHE_TTL
 from coffee.io.lcd import LCD, single_lcd_write
 
 from .db import Database
 
+# Characters selectable with the encoder when naming a button (the last one validates)
+_VALUES = tuple("ABCDEFGHIJKLMNOPQRSTUVWXYZ" + CUSTOM_CHARS_IDX["enter"])
+
+# Bumped whenever a page writes to the database, invalidating the cached query results
+_db_generation = 0
+
+
+def _bump_db_generation() -> None:
+    global _db_generation
+    _db_generation += 1
+
 
 class Page:
     """Base class for LCD application pages.
 
     Subclasses can override any of the input callback methods to implement
     navigation or behaviour. To trigger a page transition simply return a new
-    `Page` instance; returning `None` keeps the current page (but will
-    refresh it by running `.display()`).
+    `Page` instance; returning `None` keeps the current page. In that case the
+    page is only refreshed (by running `.display()`) if the callback marked it
+    as ``dirty``.
+
+    The screen is not cleared between pages: `display` should draw every row
+    (e.g. with `LCD.write_line`, which only sends the characters that changed).
     """
 
+    # Pages are created on every transition (e.g. one `MugPage` per served
+    # mug), so keep instances small and skip the per-instance `__dict__`
+    __slots__ = ("lcd", "db", "dirty")
+
     def __init__(
         self,
     ):
         """Initialize a new page."""
-        pass
+        # Set by callbacks that change the visible content of the page
+        self.dirty = False
 
-    def set_lcd(self, lcd: LCD) -> "Page":
-        """Associate this page with an LCD instance and return self."""
+    def set_lcd(self, lcd: LCD, db: Optional[Database] = None) -> "Page":
+        """Associate this page with an LCD instance and return self.
+
+        Parameters
+        ----------
+        lcd:
+            The LCD to draw on.
+        db:
+            The application `Database`, shared by every page rather than
+            creating one per callback (defaults to a new `Database`).
+        """
         self.lcd = lcd
+        self.db = db if db is not None else Database()
         return self
 
-    @single_lcd_write  # type: ignore[misc]
+    @single_lcd_write
     def display(self) -> None:
-        self.lcd.move_to(0, 0)
-        self.lcd.putstr("My Page")
+        self.lcd.write_line("My Page", row=0)
+        self.lcd.write_line("", row=1)
 
-    @single_lcd_write  # type: ignore[misc]
+    @single_lcd_write
     def display_temporary(
         self,
         first_line: Optional[str] = None,
         second_line: Optional[str] = None,
         duration: int = 1,
     ) -> None:
-        """Temporarily display one or two lines then pause.
+        """Temporarily display one or two lines.
+
+        This does not block: the LCD is put on hold, so that the application
+        defers the next redraw until the message was shown for ``duration``
+        seconds (any new input event ends the hold early).
 
         Parameters
         ----------
@@ -60,20 +95,14 @@ class Page:
         duration:
             Time in seconds to keep the message visible.
         """
-        self.lcd.clear()
-        if first_line is not None:
-            self.lcd.move_to(0, 0)
-            self.lcd.putstr(first_line)
-        if second_line is not None:
-            self.lcd.move_to(0, 1)
-            self.lcd.putstr(second_line)
-
-        time.sleep(duration)
+        self.lcd.write_line(first_line or "", row=0)
+        self.lcd.write_line(second_line or "", row=1)
+        self.lcd.hold_until = time.monotonic() + duration
 
     def timeout_callback(self) -> Optional["Page"]:
         return self.red_button_callback()
 
-    def encoder_callback(self, clockwise: bool) -> Optional["Page"]:
+    def encoder_callback(self, delta: int) -> Optional["Page"]:
         pass
 
     def encoder_button_callback(self) -> Optional["Page"]:
@@ -91,16 +120,18 @@ class Page:
 class HomePage(Page):
     """Default home page displayed when the application starts or times out."""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
         #self.has_timed_out = False
 
-    @single_lcd_write  # type: ignore[misc]
+    @single_lcd_write
     def display(self) -> None:
-        self.lcd.move_to(0, 0)
-        self.lcd.putstr("Bonjour !")
+        self.lcd.write_line("Bonjour !", row=0)
+        self.lcd.write_line("", row=1)
 
-    def encoder_callback(self, clockwise: bool) -> Optional["Page"]:
+    def encoder_callback(self, delta: int) -> Optional["Page"]:
         return MenuPage()
 
     def person_button_callback(self, button_id: int) -> Optional["Page"]:
@@ -115,90 +146,111 @@ class HomePage(Page):
 class NameButtonPage(Page):
     """Interactive page for assigning human-readable names to buttons."""
 
-    values = list("ABCDEFGHIJKLMNOPQRSTUVWXYZ") + [CUSTOM_CHARS_IDX["enter"]]
+    __slots__ = ("button_id", "name_buf", "encoder_idx")
 
     def __init__(self):
         super().__init__()
         self.button_id = None
-        self.name = ""
+        # Characters entered so far, appended in place
+        self.name_buf = bytearray()
         self.encoder_idx = 0
 
-    @single_lcd_write  # type: ignore[misc]
+    @property
+    def name(self) -> str:
+        """The name entered so far."""
+        return self.name_buf.decode("ascii")
+
+    @single_lcd_write
     def display(self) -> None:
-        self.lcd.clear()
-        self.lcd.move_to(0, 0)
         if not self.button_id:
-            self.lcd.putstr("Quel bouton ?")
+            self.lcd.write_line("Quel bouton ?", row=0)
+            self.lcd.write_line("", row=1)
         else:
-            self.lcd.putstr(f"{self.button_id} - Quel nom ?")
-            self.lcd.move_to(0, 1)
-            self.lcd.putstr(self.name)
-            self.lcd.putchar(self.values[self.encoder_idx])
+            self.lcd.write_line(f"{self.button_id} - Quel nom ?", row=0)
+            self.lcd.write_line(self.name + _VALUES[self.encoder_idx], row=1)
 
-    def encoder_callback(self, clockwise: bool) -> Optional["Page"]:
-        increment = 1 if clockwise else -1
-        self.encoder_idx = (self.encoder_idx + increment) % len(self.values)
+    def encoder_callback(self, delta: int) -> Optional["Page"]:
+        self.encoder_idx = (self.encoder_idx + delta) % len(_VALUES)
+        self.dirty = True
 
     def encoder_button_callback(self) -> Optional["Page"]:
         """Save name"""
-        value = self.values[self.encoder_idx]
+        value = _VALUES[self.encoder_idx]
         if (
             (value == CUSTOM_CHARS_IDX["enter"])
-            and self.name
+            and self.name_buf
             and (self.button_id is not None)
         ):
             print("Enter")
-            with Database() as db:
-                db.add_user(button_id=self.button_id, name=self.name)
-                self.display_temporary("Nom enregistre:", self.name)
+            name = self.name
+            with self.db as db:
+                db.add_user(button_id=self.button_id, name=name)
+            _bump_db_generation()
+            self.display_temporary("Nom enregistre:", name)
             return MenuPage()
         else:
-            self.name += value
+            self.name_buf.append(ord(value))
             self.encoder_idx = 0
+            self.dirty = True
 
     def person_button_callback(self, button_id: int) -> Optional["Page"]:
         self.button_id = button_id
+        self.dirty = True
 
 
 class PersonPage(Page):
     """Display personalised greeting and consumption statistics for a user."""
 
+    __slots__ = ("button_id",)
+
+    # (name, number of mugs, volume) of the day, by (button_id, date).
+    # Shared by all instances, and cleared when the database generation changes.
+    _cache: Dict[Tuple[int, date], Tuple[Union[str, int], int, float]] = {}
+    _cache_generation = 0
+
     def __init__(self, button_id: int):
         super().__init__()
         self.button_id = button_id
 
-    @single_lcd_write  # type: ignore[misc]
+    @single_lcd_write
     def display(self) -> None:
-        with Database() as db:
-            name = db.get_name(self.button_id)
-            mugs = db.get_mugs(name)
-        self.lcd.move_to(0, 0)
-        self.lcd.putstr(f"{name}:")
-        self.lcd.move_to(0, 1)
-
-        mugs_today = [
-            mug for mug in mugs if mug["datetime"].date() == datetime.now().date()
-        ]
-        n = len(mugs_today)
+        if PersonPage._cache_generation != _db_generation:
+            PersonPage._cache.clear()
+            PersonPage._cache_generation = _db_generation
+
+        key = (self.button_id, date.today())
+        if key not in self._cache:
+            with self.db as db:
+                name = db.get_name(self.button_id)
+                self._cache[key] = (name, *db.get_today_stats(name))
+        name, n, volume_today = self._cache[key]
+
+        self.lcd.write_line(f"{name}:", row=0)
         mug_str = "tasse" if n < 2 else "tasses"
-        volume_today = sum(mug["value"] for mug in mugs_today)
 
         message = f"Ajd: {n} {mug_str} - {int(volume_today)} mL"
         self.lcd.scroll_message(message, row=1, sleep=0.2)
 
     def person_button_callback(self, button_id: int) -> Optional["Page"]:
         self.button_id = button_id
+        self.dirty = True
 
 
 class MugPage(Page):
     """Handle mug serving workflow, weight assignment and validation."""
 
+    __slots__ = ("mug_value", "person_ids", "timeout")
+
     def __init__(
-        self, mug_value: Optional[float] = None, person_ids: Optional[List[int]] = None
+        self,
+        mug_value: Optional[float] = None,
+        person_ids: Optional[Collection[int]] = None,
     ):
         super().__init__()
         self.mug_value = mug_value
-        self.person_ids = person_ids if person_ids is not None else []
+        # Used as an ordered set (values are unused): O(1) membership test, and the
+        # red button removes the last added person
+        self.person_ids: Dict[int, None] = dict.fromkeys(person_ids or ())
         self.timeout = 5  # shorter timeout here
 
     @single_lcd_write
@@ -206,27 +258,32 @@ class MugPage(Page):
         if self.mug_value is None:
             # Pot is removed
             print("Service...")
+            self.lcd.write_line("", row=1)
             self.lcd.blink("Service...")
 
         else:
-            self.lcd.move_to(0, 0)
-            self.lcd.putstr(f"{int(self.mug_value)}mL - Pour ?")
+            self.lcd.write_line(f"{int(self.mug_value)}mL - Pour ?", row=0)
 
             if self.person_ids:
-                with Database() as db:
-                    names = [str(db.get_name(person_id)) for person_id in self.person_ids]
-                message = " + ".join(names)
+                with self.db as db:
+                    names = db.get_names(self.person_ids).values()
+                message = " + ".join(map(str, names))
                 self.lcd.scroll_message(message, row=1, sleep=0.15)
+            else:
+                self.lcd.write_line("", row=1)
 
     def person_button_callback(self, button_id: int) -> Optional["Page"]:
         if button_id not in self.person_ids:
-            self.person_ids.append(str(button_id))
+            self.person_ids[button_id] = None
+            self.dirty = True
 
     def encoder_button_callback(self) -> Optional["Page"]:
         if self.mug_value is not None:
-            with Database() as db:
-                for person_id in self.person_ids:
-                    db.add_mug(person_id, self.mug_value / len(self.person_ids))
+            if self.person_ids:
+                value = self.mug_value / len(self.person_ids)
+                with self.db as db:
+                    db.add_mugs((person_id, value) for person_id in self.person_ids)
+                _bump_db_generation()
             self.display_temporary("OK !", duration=2)
         return HomePage()
 
@@ -234,35 +291,40 @@ class MugPage(Page):
         # Remove all person recorded for the current mug (if any)
         # Else, back to main page
         if self.person_ids:
-            self.person_ids = self.person_ids[:-1]
+            self.person_ids.popitem()
+            self.dirty = True
         else:
             self.display_temporary("Annule tasse...")
             return HomePage()
 
     def timeout_callback(self) -> Optional["Page"]:
         if self.person_ids:
-            self.encoder_button_callback()
+            return self.encoder_button_callback()
 
 
 class ShutdownPage(Page):
     """Page used to trigger system shutdown or restart."""
 
+    __slots__ = ("restart",)
+
     def __init__(self, restart: bool = False):
+        super().__init__()
         self.restart = restart
 
     @single_lcd_write
     def display(self) -> None:
-        if self.restart:
-            self.display_temporary("Restart ...", duration=2)
-            subprocess.check_output("sudo shutdown -r now", shell=True, text=True)
-        else:
-            self.display_temporary("Shutdown ...", duration=2)
-            self.lcd.turn_off()
-            subprocess.check_output("sudo shutdown -h now", shell=True, text=True)
+        # The message stays on screen until the application is stopped by the
+        # shutdown (the LCD is then turned off by the cleanup of scripts/main.py)
+        self.display_temporary("Restart ..." if self.restart else "Shutdown ...")
+        # Commit anything pending before the system goes down
+        self.db.close()
+        subprocess.Popen(["sudo", "shutdown", "-r" if self.restart else "-h", "now"])
 
 class HostnamePage(Page):
     """Show hostname"""
 
+    __slots__ = ()
+
     @single_lcd_write
     def display(self) -> None:
         try:
@@ -274,27 +336,41 @@ class HostnamePage(Page):
 class StatsPage(Page):
     """Display aggregated statistics (total mugs and volume)."""
 
-    def __init__(self):
-        with Database() as db:
-            self.stats = db.get_sum()
+    __slots__ = ()
+
+    # (time.monotonic() of the query, database generation, stats), shared by all instances
+    _cache: Optional[Tuple[float, int, dict]] = None
 
     @single_lcd_write
     def display(self) -> None:
+        now = time.monotonic()
+        cache = StatsPage._cache
+        if (
+            cache is None
+            or cache[1] != _db_generation
+            or now - cache[0] > STATS_CACHE_TTL
+        ):
+            with self.db as db:
+                cache = StatsPage._cache = (now, _db_generation, db.get_sum())
+        stats = cache[2]
         self.display_temporary(
-            f"{self.stats['count']} tasses",
-            f"{1e-3 * self.stats['sum']:.2f} L",
+            f"{stats['count']} tasses",
+            f"{1e-3 * stats['sum']:.2f} L",
         )
 
 
 class MenuPage(Page):
     """Main menu listing administrative / utility pages."""
 
+    __slots__ = ("encoder_idx",)
+
+    # (name, page factory): pages are only built once selected
     PAGES = [
-        dict(name="Nommer bouton", page=NameButtonPage()),
-        dict(name="Stats", page=StatsPage()),
-        dict(name="Host name", page=HostnamePage()),
-        dict(name="Eteindre", page=ShutdownPage()),
-        dict(name="Redemarrer", page=ShutdownPage(restart=True)),
+        ("Nommer bouton", NameButtonPage),
+        ("Stats", StatsPage),
+        ("Host name", HostnamePage),
+        ("Eteindre", ShutdownPage),
+        ("Redemarrer", partial(ShutdownPage, restart=True)),
     ]
 
     def __init__(self):
@@ -303,14 +379,12 @@ class MenuPage(Page):
 
     @single_lcd_write
     def display(self) -> None:
-        self.lcd.move_to(0, 0)
-        self.lcd.putstr("Menu...")
-        self.lcd.move_to(0, 1)
-        self.lcd.putstr(self.PAGES[self.encoder_idx]["name"])
+        self.lcd.write_line("Menu...", row=0)
+        self.lcd.write_line(self.PAGES[self.encoder_idx][0], row=1)
 
-    def encoder_callback(self, clockwise: bool) -> Optional["Page"]:
-        increment = 1 if clockwise else -1
-        self.encoder_idx = (self.encoder_idx + increment) % len(self.PAGES)
+    def encoder_callback(self, delta: int) -> Optional["Page"]:
+        self.encoder_idx = (self.encoder_idx + delta) % len(self.PAGES)
+        self.dirty = True
 
     def encoder_button_callback(self) -> Optional["Page"]:
-        return self.PAGES[self.encoder_idx]["page"]
+        return self.PAGES[self.encoder_idx][1]()
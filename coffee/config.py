@@ -15,8 +15,28 @@ POT_WEIGHT_THRESHOLD = 80
 # Number of scale reading to do before returning the median
 NUM_SCALE_READINGS = 5
 
+# A scale reading stops early (before NUM_SCALE_READINGS) once two consecutive samples are within
+# this tolerance (in g) of each other: their mean is then used instead of the median of all readings
+SCALE_READING_TOLERANCE = 5
+
 # Number of median (from above) scale values to compute STD on to fetch a stable value
 LEN_SCALE_BUFFER = 3
 
+# Optional CPU core dedicated to the scale reading process, to reduce sampling jitter (e.g. 3 on
+# the 4-core Pi 3/4). Once pinned there, the process is also given this real-time (SCHED_FIFO)
+# priority, which needs CAP_SYS_NICE and can starve anything else on that core.
+# None (default) leaves the process to the default scheduling
+SCALE_WRITER_CPU = None
+SCALE_WRITER_PRIORITY = 10
+
 # Default timeout duration (number of s before LCD goes back to main page)
-DEFAULT_LCD_TIMEOUT = 10
\ No newline at end of file
+DEFAULT_LCD_TIMEOUT = 10
+
+# Maximum age (in s) of the cached aggregated statistics shown by the stats page
+STATS_CACHE_TTL = 60
+
+# Rotary encoder ticks are coalesced before being forwarded to the current page, so that a fast
+# rotation triggers a single redraw. Pending ticks are flushed once ENCODER_COALESCE_COUNT ticks
+# were received, or ENCODER_COALESCE_DELAY seconds after the first pending tick (whichever first)
+ENCODER_COALESCE_COUNT = 4
+ENCODER_COALESCE_DELAY = 0.05
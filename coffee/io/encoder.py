@@ -14,6 +14,21 @@ from coffee.app.page import Page
 
 Device.pin_factory = PiGPIOFactory()
 
+# Rotation direction (ord("R") / ord("L"), 0 for no rotation) of each transition
+# between two states of the quadrature signal, where a state is (clk << 1) | data.
+# Indexed by (state << 2) | new_state.
+_DIRECTIONS = bytearray(16)
+for _transition, _direction in (
+    (0b00_01, "R"),
+    (0b00_10, "L"),
+    (0b01_11, "R"),
+    (0b01_00, "L"),
+    (0b10_11, "L"),
+    (0b10_00, "R"),
+):
+    _DIRECTIONS[_transition] = ord(_direction)
+_LEFT = ord("L")
+
 
 class RotationCallback(Protocol):
     def __call__(self, clockwise: bool) -> Optional[Page]: ...  # pragma: no cover
@@ -46,7 +61,7 @@ class Encoder:
         self.data_pin = Button(data_pin, pull_up=False)
 
         self.value = 0
-        self.state = "00"
+        self.state = 0b00
         self.direction = None
         self.encoder_callback = encoder_callback
 
@@ -78,23 +93,13 @@ class Encoder:
         Processes GPIO pin state changes to determine clockwise or
         counterclockwise rotation based on quadrature encoding.
         """
-        p1 = int(self.clk_pin.is_pressed)
-        p2 = int(self.data_pin.is_pressed)
-        newState = f"{p1}{p2}"
-
-        # (state, newState) -> direction
-        mapping = {
-            ("00", "01"): "R",
-            ("00", "10"): "L",
-            ("01", "11"): "R",
-            ("01", "00"): "L",
-            ("10", "11"): "L",
-            ("10", "00"): "R",
-        }
-        self.direction = mapping.get((self.state, newState))
-        if self.direction and (newState == "00") and self.encoder_callback:
-            self.encoder_callback(self.direction == "L")
-        self.state = newState
+        new_state = (self.clk_pin.is_pressed << 1) | self.data_pin.is_pressed
+        direction = _DIRECTIONS[(self.state << 2) | new_state]
+        self.direction = chr(direction) if direction else None
+        # A detent is reached when both signals are back to 0
+        if direction and not new_state and self.encoder_callback:
+            self.encoder_callback(direction == _LEFT)
+        self.state = new_state
 
     def get_value(self) -> int:
         """Return the raw internal value (currently unused incrementally)."""
@@ -0,0 +1,21 @@
+"""Shared I2C bus.
+
+The LCD backpack and the MCP23017 button multiplexer sit on the same I2C bus.
+Rather than each opening its own handle, they share the one returned by
+`get_bus`, and hold `BUS_LOCK` around their multi-transaction sequences so
+that these are not interleaved.
+"""
+
+import threading
+from functools import lru_cache
+
+import smbus
+
+# Serializes the use of the shared bus across threads
+BUS_LOCK = threading.RLock()
+
+
+@lru_cache(maxsize=None)
+def get_bus(port: int = 1) -> smbus.SMBus:
+    """Return the shared handle of an I2C bus, opened on first use."""
+    return smbus.SMBus(port)
@@ -5,51 +5,85 @@ Provides a thin wrapper around the third-party :class:`I2cLcd` to add:
 * Thread-safe scrolling messages
 * Blinking backlight messages
 * A decorator to cancel any previous animation before drawing new content
+* Delta-only line writes, based on a shadow copy of the displayed characters
 """
 
+import logging
+import queue
 import threading
-import time
-from typing import Any, Callable
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple, TypeVar
 
-import wrapt
-from lcd.i2c_lcd import I2cLcd
+from lcd.i2c_lcd import MASK_E, MASK_RS, SHIFT_BACKLIGHT, SHIFT_DATA, I2cLcd
 
 from coffee.config import CUSTOM_CHARS
+from coffee.io.i2c_bus import BUS_LOCK, get_bus
 
+T = TypeVar("T")
 
-@wrapt.decorator
-def single_lcd_write(
-    wrapped: Callable, instance: Any, args: tuple, kwargs: dict
-) -> Any:  # type: ignore[override]
+# An animation (scroll, blink), run by the LCD thread until its stop event is set
+Animation = Callable[[threading.Event], None]
+# A queued animation, with its stop event and the event set once it has returned
+AnimationJob = Tuple[Animation, threading.Event, threading.Event]
+
+logger = logging.getLogger(__name__)
+
+# Maximum time (in s) to wait for an animation to stop. Animations wait on their
+# stop event between steps, so they normally end within a single I2C write.
+LCD_ANIMATION_STOP_TIMEOUT = 1.0
+
+# Number of bytes sent to the I2C backpack per SMBus block write (1 command byte +
+# 31 data bytes, the SMBus limit being 32 data bytes), i.e. 8 characters
+I2C_BLOCK_SIZE = 32
+
+
+def _nibble_table(flags: int) -> Tuple[bytes, ...]:
+    """
+    Build the 4 bytes sending each byte value to the LCD through the I2C
+    expander: both nibbles, each latched on the falling edge of E. `flags` holds
+    the RS and backlight bits.
+    """
+    table = []
+    for data in range(256):
+        high = flags | ((data >> 4) << SHIFT_DATA)
+        low = flags | ((data & 0x0F) << SHIFT_DATA)
+        table.append(bytes((high | MASK_E, high, low | MASK_E, low)))
+    return tuple(table)
+
+
+# Expander sequences of every byte value, indexed by backlight state then value
+_COMMAND_NIBBLES = tuple(_nibble_table(bl << SHIFT_BACKLIGHT) for bl in (0, 1))
+_DATA_NIBBLES = tuple(_nibble_table(MASK_RS | bl << SHIFT_BACKLIGHT) for bl in (0, 1))
+
+# Bitmaps of the custom characters, in CGRAM order (8 bytes each, 8 locations available)
+_CUSTOM_CHARS_DATA = b"".join(bytes(array) for array in list(CUSTOM_CHARS.values())[:8])
+
+
+def single_lcd_write(wrapped: Callable[..., T]) -> Callable[..., T]:
     """
     Decorator to ensure single LCD write operations by managing LCD threads.
 
-    Stops any running LCD thread before executing the wrapped function and
-    clears the stop event for new threads.
+    Stops any running LCD animation before executing the wrapped method, while
+    holding the LCD lock (so that no other thread starts one meanwhile).
+
+    The wrapped method either belongs to `LCD` itself, or to an object holding
+    the LCD as its ``lcd`` attribute (e.g. pages): this is resolved from the
+    instance, on each call.
 
     Args:
-        wrapped: The function being decorated
-        instance: The instance the method is called on
-        args: Positional arguments for the wrapped function
-        kwargs: Keyword arguments for the wrapped function
+        wrapped: The method being decorated
 
     Returns:
-        The result of the wrapped function
+        The decorated method
     """
-    # Kill any LCD writing thread
-    if hasattr(instance, "lcd"):
-        instance = instance.lcd
-    if hasattr(instance, "lcd_thread"):
-        # Stop any currently running scroll thread
-        if instance.lcd_thread and instance.lcd_thread.is_alive():
-            print("has thread")
-            instance.stop_event.set()
-            instance.lcd_thread.join()
-            time.sleep(0.2)
-        # Clear the stop flag for the new thread
-        instance.stop_event.clear()
-
-    return wrapped(*args, **kwargs)
+    @wraps(wrapped)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> T:
+        lcd = getattr(self, "lcd", self)
+        with lcd.lcd_lock:
+            lcd.stop_animation()
+            return wrapped(self, *args, **kwargs)
+
+    return wrapper
 
 
 class LCD(I2cLcd):
@@ -57,6 +91,8 @@ class LCD(I2cLcd):
     Enhanced LCD class with scrolling and blinking capabilities.
 
     Extends I2cLcd with thread-safe scrolling messages and blinking functionality.
+    A shadow copy of the displayed characters (`frame`) is maintained so that
+    `write_line` only sends the characters that actually changed over I2C.
     """
 
     def __init__(
@@ -75,18 +111,179 @@ class LCD(I2cLcd):
             num_lines: Number of lines on the LCD
             num_columns: Number of columns on the LCD
         """
+        # Shadow copy of the displayed characters (reset on `clear`)
+        self.frame = [" " * num_columns] * num_lines
+        # Set before initializing the LCD, which calls the (decorated) `clear`.
+        # Animations run one at a time on a single, long-lived thread; each one
+        # gets its own stop event, and a "done" event set once it has returned.
+        # The lock serializes stopping the running animation and drawing /
+        # starting a new one.
+        self.animations: "queue.SimpleQueue[AnimationJob]" = queue.SimpleQueue()
+        self.stop_event = threading.Event()
+        self.animation_done = threading.Event()
+        self.animation_done.set()
+        self.lcd_lock = threading.RLock()
+        # Last "display on/off control" command sent (display, cursor and blink flags)
+        self.display_control = None
         super().__init__(port, i2c_addr, num_lines, num_columns)
+        # Swap the handle opened by `I2cLcd` for the one shared with other devices
+        self.bus.close()
+        self.bus = get_bus(port)
 
-        self.lcd_thread = None
-        self.stop_event = threading.Event()
+        self.lcd_thread = threading.Thread(target=self.run_animations, daemon=True)
+        self.lcd_thread.start()
+
+        self.is_on = True
+        # Monotonic time until which the displayed content must be kept (see
+        # `Page.display_temporary`)
+        self.hold_until = 0.0
 
         self.register_custom_characters()
 
+    def hal_write_command(self, cmd: int) -> None:
+        """
+        Write a command to the LCD, skipping redundant display control commands.
+
+        `display_on`, `hide_cursor`, `blink_cursor_off`... all write the whole
+        display control register: the command is not sent again if the register
+        already holds the requested flags.
+        """
+        if cmd & ~0x07 == self.LCD_ON_CTRL:
+            if cmd == self.display_control:
+                return
+            self.display_control = cmd
+        with BUS_LOCK:
+            super().hal_write_command(cmd)
+
+    def putchar(self, char: str) -> None:
+        """Write a character at the cursor position, keeping `frame` up to date."""
+        if char != "\n":
+            x, y = self.cursor_x, self.cursor_y
+            self.frame[y] = self.frame[y][:x] + char + self.frame[y][x + 1 :]
+        super().putchar(char)
+
+    def write_line(self, text: str, row: int = 0) -> None:
+        """
+        Display a text on a whole row, only writing the characters that changed.
+
+        The text is truncated or padded with spaces to the width of the LCD, then
+        compared to what is currently displayed: only the runs of differing
+        characters are written (one cursor move per run).
+
+        Args:
+            text: The text to display
+            row: The row number to display on (0 or 1)
+        """
+        text = text[: self.num_columns].ljust(self.num_columns)
+        current = self.frame[row]
+        col = 0
+        while col < self.num_columns:
+            if text[col] == current[col]:
+                col += 1
+                continue
+            end = col + 1
+            while end < self.num_columns and text[end] != current[end]:
+                end += 1
+            # The LCD auto-increments its address, a single move is enough per run
+            self.write_chars(text[col:end], col=col, row=row)
+            col = end
+        self.frame[row] = text
+
+    def run_animations(self) -> None:
+        """Run the queued animations, one after the other (LCD thread loop)."""
+        while True:
+            animation, stop_event, done = self.animations.get()
+            try:
+                if not stop_event.is_set():
+                    animation(stop_event)
+            except Exception:
+                logger.exception("LCD animation failed")
+            finally:
+                done.set()
+
+    def stop_animation(self) -> None:
+        """Stop the running (or queued) scroll / blink animation, if any."""
+        with self.lcd_lock:
+            if not self.animation_done.is_set():
+                logger.debug("Stopping the running animation")
+                self.stop_event.set()
+                # The animation ends right after its current write: no need to wait more
+                self.animation_done.wait(LCD_ANIMATION_STOP_TIMEOUT)
+
+    def start_animation(self, animation: Animation) -> None:
+        """
+        Stop the running animation (if any) and queue a new one on the LCD thread.
+
+        Args:
+            animation: The function to run, given the stop event of this animation only
+        """
+        with self.lcd_lock:
+            self.stop_animation()
+            self.stop_event = threading.Event()
+            self.animation_done = threading.Event()
+            self.animations.put((animation, self.stop_event, self.animation_done))
+
+    def write_chars(
+        self, chars: str, col: Optional[int] = None, row: Optional[int] = None
+    ) -> None:
+        """
+        Write characters to the LCD, with bulk I2C transfers.
+
+        Each character takes 4 bytes on the I2C expander (both nibbles, each
+        latched on the falling edge of E). Rather than one transaction per byte
+        (as `hal_write_data` does), they are sent by blocks of `I2C_BLOCK_SIZE`.
+
+        When a position is given, the command moving the LCD address there (as
+        `move_to`) is sent in the same burst, ahead of the characters. Otherwise
+        the characters are written from the current address. The cursor
+        attributes (`cursor_x`, `cursor_y`) are only updated by the move.
+
+        Args:
+            chars: The characters to write
+            col: The column to write from
+            row: The row to write on
+        """
+        backlight = int(self.backlight)
+        buf = bytearray()
+        if col is not None and row is not None:
+            self.cursor_x, self.cursor_y = col, row
+            addr = col & 0x3F
+            if row & 1:
+                addr += 0x40  # Lines 1 & 3 add 0x40
+            if row & 2:
+                addr += self.num_columns  # Lines 2 & 3 add number of columns
+            buf += _COMMAND_NIBBLES[backlight][self.LCD_DDRAM | addr]
+        data = _DATA_NIBBLES[backlight]
+        buf += b"".join(map(data.__getitem__, chars.encode("latin-1")))
+        self.write_expander_bytes(buf)
+
+    def write_expander_bytes(self, buf: bytes) -> None:
+        """
+        Send raw bytes to the I2C expander, by blocks of `I2C_BLOCK_SIZE`.
+
+        Args:
+            buf: The expander bytes (see `_nibble_table`)
+        """
+        with BUS_LOCK:
+            for idx in range(0, len(buf), I2C_BLOCK_SIZE):
+                self.bus.write_i2c_block_data(
+                    self.i2c_addr, buf[idx], list(buf[idx + 1 : idx + I2C_BLOCK_SIZE])
+                )
+
     def register_custom_characters(self) -> None:
-        """Register custom characters from the configuration."""
-        for idx, (name, array) in enumerate(CUSTOM_CHARS.items()):
-            if idx < 8:  # 8 addresses available
-                self.custom_char(idx, array)
+        """
+        Register custom characters from the configuration.
+
+        CGRAM addresses auto-increment: all the bitmaps are written in a single
+        burst from address 0, instead of one `custom_char` call per character.
+        """
+        backlight = int(self.backlight)
+        data = _DATA_NIBBLES[backlight]
+        buf = bytearray(_COMMAND_NIBBLES[backlight][self.LCD_CGRAM])
+        buf += b"".join(map(data.__getitem__, _CUSTOM_CHARS_DATA))
+        self.write_expander_bytes(buf)
+        # Back to DDRAM, as `custom_char` does
+        self.move_to(self.cursor_x, self.cursor_y)
 
     @single_lcd_write
     def scroll_message(self, message: str, row: int = 0, sleep: float = 0.5) -> None:
@@ -99,27 +296,25 @@ class LCD(I2cLcd):
             sleep: Time in seconds between scroll steps
         """
 
-        # Start a new scrolling thread
-        def worker() -> None:
-            self.hide_cursor()
-            self.blink_cursor_off()
-            self.hide_cursor()
-            self.move_to(0, row)
+        # All the frames are computed upfront, the message entering from the right
+        # and leaving on the left. Each one is written with `write_line`, so only
+        # the characters that differ from the previous frame go over I2C.
+        n = self.num_columns
+        tmp_message = n * " " + message + n * " "
+        frames = [tmp_message[idx : idx + n] for idx in range(n + 1 + len(message))]
 
-            n = 15
-            tmp_message = (n + 1) * " " + message + (n + 1) * " "
+        def worker(stop_event: threading.Event) -> None:
+            self.hide_cursor()
 
-            for idx in range(n + 2 + len(message)):
-                if self.stop_event.is_set():
-                    print("Done scroll")
+            for frame in frames:
+                if stop_event.is_set():
+                    logger.debug("Scroll stopped")
                     break  # Stop immediately if a new message comes in
 
-                self.move_to(0, row)
-                self.putstr(tmp_message[idx : idx + n])
-                time.sleep(sleep)
+                self.write_line(frame, row=row)
+                stop_event.wait(sleep)
 
-        self.lcd_thread = threading.Thread(target=worker, daemon=True)
-        self.lcd_thread.start()
+        self.start_animation(worker)
 
     # @single_lcd_write
     def blink(self, message: str, interval: float = 0.5, n: int = -1) -> None:
@@ -131,34 +326,40 @@ class LCD(I2cLcd):
             n: Number of blinks (-1 for infinite)
         """
 
-        def worker() -> None:
-            self.move_to(0, 0)
-            self.putstr(message)
+        def worker(stop_event: threading.Event) -> None:
+            self.write_line(message, row=0)
+            on, off = self.backlight_on, self.backlight_off
+            lit = True
             idx = 0
             while True:
-                if self.stop_event.is_set() or ((n > 0) and (idx >= n)):
-                    self.backlight_on()
-                    print("Done blink")
+                if stop_event.is_set() or ((n > 0) and (idx >= n)):
+                    on()
+                    logger.debug("Blink stopped")
                     break
-                self.backlight_on() if idx % 2 else self.backlight_off()
+                lit = not lit
+                on() if lit else off()
                 idx += 1
-                time.sleep(interval)
+                stop_event.wait(interval)
 
-        self.lcd_thread = threading.Thread(target=worker, daemon=True)
-        self.lcd_thread.start()
+        self.start_animation(worker)
 
     @single_lcd_write
     def turn_off(self) -> None:
         self.clear()
         self.display_off()
         self.backlight_off()
+        self.is_on = False
 
     @single_lcd_write
     def turn_on(self) -> None:
-        self.clear()
-        self.display_on()
-        self.backlight_on()
+        # Already cleared by `turn_off`, and pages redraw every row: no need to clear
+        # (a busy wait of the controller) when switching pages
+        if not self.is_on:
+            self.display_on()
+            self.backlight_on()
+            self.is_on = True
 
     @single_lcd_write
     def clear(self) -> None:
         super().clear()
+        self.frame = [" " * self.num_columns] * self.num_lines
@@ -5,19 +5,25 @@ MCP23017 I/O expander. An interrupt pin notifies when any button changes and
 the pressed button id (0..15) is resolved from interrupt flags.
 """
 
+import logging
+import queue
+import threading
 import time
-from typing import Dict, List, Optional, Protocol
+from collections import deque
+from typing import Deque, FrozenSet, Optional, Protocol, Tuple
 
-import smbus
 from gpiozero import Button, Device
 from gpiozero.pins.pigpio import PiGPIOFactory
 from mcp23017 import *
 from mcp23017.i2c import I2C
 
 from coffee.app.page import Page
+from coffee.io.i2c_bus import BUS_LOCK, get_bus
 
 Device.pin_factory = PiGPIOFactory()
 
+logger = logging.getLogger(__name__)
+
 
 class ButtonCallback(Protocol):
     def __call__(self, button_id: int) -> Optional[Page]: ...  # pragma: no cover
@@ -38,79 +44,125 @@ class Multiplex:
         button_callback: Optional[ButtonCallback] = None,
     ):
         self.button = Button(interrupt_pin, pull_up=True, bounce_time=0.2)
-        self.i2c = I2C(smbus.SMBus(1))
+        self.address = address
+        self.i2c = I2C(get_bus(1))
         self.mcp = MCP23017(address, self.i2c.bus)
 
-        # Set all as input
-        self.mcp.set_all_input()
-
-        # Enable internal pull-up resistors
-        self.mcp.write(GPPUA, 0xFF)
-        self.mcp.write(GPPUB, 0xFF)
+        # Configured in one go, not interleaved with the LCD writes
+        with BUS_LOCK:
+            # Set all as input
+            self.mcp.set_all_input()
 
-        # Set interrupt comparison to default values
-        self.mcp.write(GPINTENA, 0xFF)
-        self.mcp.write(GPINTENB, 0xFF)
+            # With IOCON.BANK = 0 (default), A/B registers are interleaved and the
+            # register address auto-increments: each group below is a single I2C write.
 
-        # Set default value to compare against (all HIGH)
-        self.mcp.write(DEFVALA, 0xFF)
-        self.mcp.write(DEFVALB, 0xFF)
+            # Enable internal pull-up resistors (GPPUA, GPPUB)
+            self.i2c.bus.write_i2c_block_data(address, GPPUA, [0xFF] * 2)
 
-        # Compare to DEFVAL instead of previous value
-        self.mcp.write(INTCONA, 0xFF)
-        self.mcp.write(INTCONB, 0xFF)
+            # From GPINTENA to INTCONB:
+            # - GPINTENA/B: enable interrupt on change for all pins
+            # - DEFVALA/B: set default value to compare against (all HIGH)
+            # - INTCONA/B: compare to DEFVAL instead of previous value
+            self.i2c.bus.write_i2c_block_data(address, GPINTENA, [0xFF] * 6)
 
-        # Enable interrupt mirroring
-        self.mcp.set_interrupt_mirror(True)
+            # Enable interrupt mirroring
+            self.mcp.set_interrupt_mirror(True)
 
-        # Enable open-drain for interrupt output pin
-        self.mcp.set_bit_enabled(IOCONA, ODR_BIT, True)
-        self.mcp.set_bit_enabled(IOCONB, ODR_BIT, True)
+            # Enable open-drain for interrupt output pin
+            self.mcp.set_bit_enabled(IOCONA, ODR_BIT, True)
+            self.mcp.set_bit_enabled(IOCONB, ODR_BIT, True)
 
-        # Stores the time of last button press:
-        self.state: Dict[int, int] = dict()
+        # Stores the (monotonic time, button id) of recent button presses, oldest first:
+        self.state: Deque[Tuple[float, int]] = deque(maxlen=64)
 
         self.button_callback = button_callback
-        self.button.when_pressed = self.interrupt_callback
 
         # Store captures:
         self.caps_a = None
         self.caps_b = None
 
+        # The gpiozero callback only queues a token: the I2C read and the button
+        # callback run on a worker thread, so that edge detection is not delayed.
+        # A `None` token stops the worker.
+        self.interrupts: "queue.SimpleQueue[Optional[bool]]" = queue.SimpleQueue()
+        self.interrupt_thread = threading.Thread(target=self.run_interrupts, daemon=True)
+        self.interrupt_thread.start()
+        self.button.when_pressed = self.interrupt_callback
+
     def cleanup(self):
         self.button.close()
+        self.interrupts.put(None)
+        self.interrupt_thread.join(timeout=1)
 
-    def get_pressed_button_id(
-        self, flags_a: List[str], flags_b: List[str]
-    ) -> Optional[int]:
-        flags = flags_a + flags_b
-        try:
-            return flags.index("1")
-        except ValueError:
-            print("No button was pressed")
+    def get_pressed_button_id(self, flags: int) -> Optional[int]:
+        """
+        Return the id of the pressed button from the 16 bits interrupt flags
+        (INTFB << 8 | INTFA), i.e. the index of the lowest set bit.
+        """
+        if not flags:
+            logger.debug("No button was pressed")
             return None
+        return (flags & -flags).bit_length() - 1
 
     def interrupt_callback(self) -> None:
+        """Queue an MCP23017 interrupt event, to be handled by the worker thread."""
+        self.interrupts.put_nowait(True)
+
+    def run_interrupts(self) -> None:
+        """
+        Worker thread: handle the queued interrupt events until stopped.
+
+        Tokens queued meanwhile are coalesced into a single register read: the
+        interrupt line stays asserted until the registers are read, so they all
+        belong to the same interrupt.
+        """
+        while True:
+            token = self.interrupts.get()
+            while token and not self.interrupts.empty():
+                token = self.interrupts.get_nowait()
+            if token is None:
+                return
+            try:
+                self.handle_interrupt()
+            except Exception:
+                logger.exception("Error while handling a button interrupt")
+
+    def handle_interrupt(self) -> None:
         """
         Handle MCP23017 interrupt events for button presses.
 
         Reads interrupt flags, determines which button was pressed,
         and triggers the configured callback.
         """
-        flags_a, flags_b = self.mcp.read_interrupt_flags()
-        caps_a, caps_b = self.mcp.read_interrupt_captures()
-        print(flags_a, caps_a)
-        print(flags_b, caps_b)
-        pressed_id = self.get_pressed_button_id(flags_a, flags_b)
-        print("Pressed: ", pressed_id)
-
-        # Reset interrupt by reading all pins
-        self.mcp.digital_read_all()
+        # INTFA/B, INTCAPA/B and GPIOA/B are consecutive registers (IOCON.BANK = 0):
+        # read them all at once. Reading the captures / pins also resets the interrupt.
+        with BUS_LOCK:
+            flags_a, flags_b, caps_a, caps_b, _, _ = self.i2c.bus.read_i2c_block_data(
+                self.address, INTFA, 6
+            )
+        self.caps_a, self.caps_b = caps_a, caps_b
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Flags A %s - Captures A %s", f"{flags_a:08b}", f"{caps_a:08b}")
+            logger.debug("Flags B %s - Captures B %s", f"{flags_b:08b}", f"{caps_b:08b}")
+        pressed_id = self.get_pressed_button_id((flags_b << 8) | flags_a)
+        logger.debug("Pressed: %s", pressed_id)
 
         if pressed_id is not None:
-            self.state[pressed_id] = int(time.time())
+            self.state.append((time.monotonic(), pressed_id))
             if self.button_callback is not None:
                 self.button_callback(pressed_id)
 
+    def get_recent_button_ids(self, duration: float) -> FrozenSet[int]:
+        """
+        Return the ids of the buttons pressed during the last `duration` seconds.
+
+        Older presses are discarded from the state along the way.
+        """
+        cutoff = time.monotonic() - duration
+        while self.state and self.state[0][0] < cutoff:
+            self.state.popleft()
+        # Snapshot first: the interrupt thread may append meanwhile
+        return frozenset(button_id for _, button_id in list(self.state))
+
     def set_button_callback(self, button_callback: Optional[ButtonCallback]) -> None:
         self.button_callback = button_callback
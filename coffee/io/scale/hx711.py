@@ -156,17 +156,24 @@ class HX711:
     def readNextByte(self):
         byteValue = 0
 
+        # Bit-banged 8 times per byte: look up the GPIO functions and pins once
+        output, input_ = GPIO.output, GPIO.input
+        pd_sck, dout = self.PD_SCK, self.DOUT
+
         # Read bits and build the byte from top, or bottom, depending
         # on whether we are in MSB or LSB bit mode.
-        for x in range(8):
-            if self.bitFormat == "MSB":
-                # Most significant Byte first.
-                byteValue <<= 1
-                byteValue |= self.readNextBit()
-            else:
-                # Less significant Byte first.
-                byteValue >>= 1
-                byteValue |= self.readNextBit() * 0x80
+        if self.bitFormat == "MSB":
+            # Most significant Byte first.
+            for x in range(8):
+                output(pd_sck, True)
+                output(pd_sck, False)
+                byteValue = (byteValue << 1) | int(input_(dout))
+        else:
+            # Less significant Byte first.
+            for x in range(8):
+                output(pd_sck, True)
+                output(pd_sck, False)
+                byteValue = (byteValue >> 1) | (int(input_(dout)) << 7)
 
         # Return the packed byte.
         return byteValue
@@ -183,9 +190,10 @@ class HX711:
             # return None.
             return None
 
-        # Wait until HX711 is ready for us to read a sample.
+        # Wait until HX711 is ready for us to read a sample (up to a full
+        # conversion period). Yield the GIL meanwhile so that other threads run.
         while self.isReady() is not True:
-            pass
+            time.sleep(0)
 
         # Read three bytes of data from the HX711.
         firstByte = self.readNextByte()
@@ -4,14 +4,60 @@ Reads weights in a background process to avoid blocking the main UI thread
 and detects pot removal / replacement events as well as mug serving events.
 """
 
+import logging
+import math
 import multiprocessing as mp
+import os
 import statistics
-from typing import Any, Callable, List, Optional
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Tuple
 
 import HX711
 
 from coffee.app.page import Page
-from coffee.config import LEN_SCALE_BUFFER, NUM_SCALE_READINGS, POT_WEIGHT_THRESHOLD
+from coffee.config import (
+    LEN_SCALE_BUFFER,
+    NUM_SCALE_READINGS,
+    POT_WEIGHT_THRESHOLD,
+    SCALE_READING_TOLERANCE,
+    SCALE_WRITER_CPU,
+    SCALE_WRITER_PRIORITY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def sample_stdev(n: int, m2: float) -> float:
+    """
+    Return the sample standard deviation of (at least 2) values, from their
+    number and sum of squared differences from their mean (`m2`, as maintained
+    by Welford's algorithm).
+
+    Same result as `statistics.stdev`, with plain float arithmetic (the
+    `statistics` functions use exact fractions, far slower).
+    """
+    return math.sqrt(max(m2, 0.0) / (n - 1))
+
+
+def read_weight(
+    hx: HX711.SimpleHX711,
+    max_samples: int = NUM_SCALE_READINGS,
+    tolerance: float = SCALE_READING_TOLERANCE,
+) -> float:
+    """
+    Read a weight (in g) from up to `max_samples` samples.
+
+    Returns the mean of the first two consecutive samples within `tolerance` of
+    each other, so a steady scale only needs 2 samples. Otherwise returns the
+    median of all the samples, as `hx.weight(max_samples)` does.
+    """
+    samples: List[float] = []
+    for _ in range(max_samples):
+        value = float(hx.weight(1))
+        if samples and abs(value - samples[-1]) <= tolerance:
+            return (value + samples[-1]) / 2
+        samples.append(value)
+    return statistics.median(samples)
 
 
 class Scale:
@@ -38,15 +84,9 @@ class Scale:
             removed_pot_callback  # Called when pot is removed from the scale
         )
 
-        self.hx = HX711.SimpleHX711(
-            data_pin,
-            clock_pin,
-            reference_unit,
-            offset,
-            HX711.Rate.HZ_80,
-        )
-        self.hx.setUnit(HX711.Mass.Unit.G)
-        self.hx.zero()
+        # The HX711 is only opened in the reading process (see `open_hx711`),
+        # rather than inheriting GPIO handles across the fork
+        self.hx_args = (data_pin, clock_pin, reference_unit, offset)
 
         self.has_pot = True  # Flag to store if pot is on the scale or not
         self.update_mug_value = (
@@ -55,94 +95,237 @@ class Scale:
         self.stable_value = 0  # Last stable measured weight
         self.mug_value = 0  # Last measured mug value
 
-        # Signal for particular events
-        self.signals = dict(
-            POT_OFF=mp.Event(),  # Pot is off
-            POT_ON=mp.Event(),  # Pot is back on
-        )
-        for signal in self.signals.values():
-            signal.set()
+        # Number of times the writer process saw the pot removed / put back. The
+        # writer never waits for these events to be handled: `read` compares the
+        # counts with the ones it already handled.
+        self.pot_off_count = mp.RawValue("Q", 0)
+        self.pot_on_count = mp.RawValue("Q", 0)
+        self.handled_pot_off = 0
+        self.handled_pot_on = 0
+        # The writer also sends a byte through this pipe on each of these events,
+        # to wake up the main loop (see `wait_for_event`)
+        self.events, self.events_sender = mp.Pipe(duplex=False)
+        # The writer reports through this pipe whether it could open the HX711
+        # (None, or the error message), for `start_reading` to raise on failure
+        self.ready, self.ready_sender = mp.Pipe(duplex=False)
+
+        # Ring buffer of the last LEN_SCALE_BUFFER weights, shared with the writer
+        # process. There is a single producer, so no lock: the writer fills a slot
+        # (and its `stats` slots) then increments the number of values written,
+        # from which `read` finds the last values published.
+        self.buffer = mp.RawArray("d", LEN_SCALE_BUFFER)
+        self.n_values = mp.RawValue("Q", 0)
+        # Running (mean, sum of squared differences from the mean) of the ring, as
+        # of each value: slot `idx` holds the ones at `buffer[idx]`, so that they
+        # are published with it
+        self.stats = mp.RawArray("d", 2 * LEN_SCALE_BUFFER)
 
         # Placeholder for future process worker
         self.pw = None
         self.stop_event = mp.Event()
 
+    @staticmethod
+    def open_hx711(
+        data_pin: int, clock_pin: int, reference_unit: int, offset: int
+    ) -> HX711.SimpleHX711:
+        """Open and zero the HX711 sensor."""
+        hx = HX711.SimpleHX711(
+            data_pin,
+            clock_pin,
+            reference_unit,
+            offset,
+            HX711.Rate.HZ_80,
+        )
+        hx.setUnit(HX711.Mass.Unit.G)
+        hx.zero()
+        return hx
+
     @staticmethod
     def writer(
-        stack: List[float],
-        hx: HX711.SimpleHX711,
-        signals: dict[str, mp.Event],
+        buffer: Any,
+        n_values: Any,
+        stats: Any,
+        hx_args: Tuple[int, int, int, int],
+        pot_off_count: Any,
+        pot_on_count: Any,
+        events_sender: Connection,
+        ready_sender: Connection,
         stop_event: mp.Event,
     ):
         """
-        Continuous loop to read weight.
+        Continuous loop to read weight, into the `buffer` ring (see `Scale.__init__`).
+
+        Runs in the reading process, which opens the HX711 from `hx_args` (and
+        reports the outcome through `ready_sender`) and shuts it down when
+        `stop_event` is set.
+
+        The mean and squared differences of the ring are updated (Welford's
+        algorithm) as values enter and leave it, so that readers get its mean
+        and std without going over it.
         """
-        while not stop_event.is_set():
-            with mp.Lock():
-                value = float(hx.weight(NUM_SCALE_READINGS))
-                delta = value - stack[-1] if stack else 0
-                signal = None
+        try:
+            hx = Scale.open_hx711(*hx_args)
+        except Exception as e:
+            ready_sender.send(f"{type(e).__name__}: {e}")
+            raise
+        ready_sender.send(None)
+        try:
+            size = len(buffer)
+            previous = None
+            mean = m2 = 0.0
+            while not stop_event.is_set():
+                value = read_weight(hx)
+                delta = value - previous if previous is not None else 0
+                counter = None
                 if delta <= -POT_WEIGHT_THRESHOLD:
                     # Big negative weight difference: pot is removed
-                    signal = signals["POT_OFF"]
+                    counter = pot_off_count
                 elif delta >= POT_WEIGHT_THRESHOLD:
                     # Big positive weight difference: pot is back
-                    signal = signals["POT_ON"]
+                    counter = pot_on_count
+
+                n = n_values.value
+                slot = n % size
+                if n < size:
+                    # Ring filling up: add the value
+                    d = value - mean
+                    mean += d / (n + 1)
+                    m2 += d * (value - mean)
+                else:
+                    if slot == 0:
+                        # Recompute once per lap, so rounding errors don't add up
+                        mean = math.fsum(buffer) / size
+                        m2 = math.fsum((old - mean) ** 2 for old in buffer)
+                    # Ring full: replace the oldest value
+                    old = buffer[slot]
+                    new_mean = mean + (value - old) / size
+                    m2 += (value - old) * (value - new_mean + old - mean)
+                    mean = new_mean
 
-                if len(stack) >= LEN_SCALE_BUFFER:
-                    stack.pop(0)  # discard oldest
-                stack.append(value)  # push new value
+                # Overwrite the oldest value, then publish it
+                buffer[slot] = value
+                stats[2 * slot] = mean
+                stats[2 * slot + 1] = m2
+                n_values.value = n + 1
+                previous = value
 
-            if signal is not None:
-                signal.clear()
-                signal.wait()
-                signal.set()
+                if counter is not None:
+                    counter.value += 1
+                    events_sender.send_bytes(b"\0")
+        finally:
+            hx.powerDown()
+            hx.disconnect()
 
-    def start_reading(self) -> None:
+    def start_reading(self, timeout: float = 10) -> None:
         """
         Run background reading process
-        """
-        self.manager = mp.Manager()
-        self.stack = self.manager.list()
 
+        Waits (up to `timeout` s) for the process to open the HX711, and raises
+        a RuntimeError if it could not.
+        """
         self.pw = mp.Process(
             target=Scale.writer,
-            args=(self.stack, self.hx, self.signals, self.stop_event),
+            args=(
+                self.buffer,
+                self.n_values,
+                self.stats,
+                self.hx_args,
+                self.pot_off_count,
+                self.pot_on_count,
+                self.events_sender,
+                self.ready_sender,
+                self.stop_event,
+            ),
         )
         self.pw.start()
+        error = self.ready.recv() if self.ready.poll(timeout) else "timed out"
+        if error is not None:
+            self.stop_reading()
+            raise RuntimeError(f"Could not open the HX711: {error}")
+        self.set_writer_scheduling()
+
+    def set_writer_scheduling(self) -> None:
+        """
+        Pin the reading process to `SCALE_WRITER_CPU`, with the real-time
+        `SCALE_WRITER_PRIORITY`. Opt-in: nothing is done when the CPU is unset.
+
+        The priority is only raised once pinned, so that the process cannot
+        starve the UI. Failures (e.g. missing core, or no CAP_SYS_NICE for
+        SCHED_FIFO) are logged: the process keeps the default scheduling.
+        """
+        if SCALE_WRITER_CPU is None or self.pw is None:
+            return
+        try:
+            os.sched_setaffinity(self.pw.pid, {SCALE_WRITER_CPU})
+            os.sched_setscheduler(
+                self.pw.pid, os.SCHED_FIFO, os.sched_param(SCALE_WRITER_PRIORITY)
+            )
+        except OSError as e:
+            logger.warning("Could not set the scale process scheduling: %s", e)
+
+    def wait_for_event(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the reading process sees the pot removed or put back, or
+        until `timeout` (in s) expires. Returns whether an event happened.
+
+        Pending wake-ups are consumed: the events themselves are handled by `read`.
+        """
+        if not self.events.poll(timeout):
+            return False
+        while self.events.poll():
+            self.events.recv_bytes()
+        return True
+
+    def wake(self) -> None:
+        """
+        Wake up a pending `wait_for_event` right away, as a pot event would.
+
+        Only writes to a pipe, so it is safe to call from a signal handler.
+        """
+        self.events_sender.send_bytes(b"\0")
 
     def read(self) -> Optional[float]:
         """
         Single reading from the background process weight's stack
+
+        Raises a RuntimeError if the background process has died.
         """
-        readings = [v for v in self.stack]
-        if len(readings) < 2:  # Only happens at beginning
+        if self.pw is not None and self.pw.exitcode is not None:
+            raise RuntimeError(f"Scale process exited with code {self.pw.exitcode}")
+        n = self.n_values.value
+        if n < 2:  # Only happens at beginning
             return
 
-        delta = readings[-1] - readings[-2]
-        if not self.signals["POT_OFF"].is_set():
-            print(f"Pot is removed - Delta: {delta:.1f}")
+        # Slots are only overwritten LEN_SCALE_BUFFER values later
+        size = len(self.buffer)
+        last = (n - 1) % size
+        delta = self.buffer[last] - self.buffer[(n - 2) % size]
+        # One event per call, removal first: a return seen meanwhile is handled next time
+        pot_off_count = self.pot_off_count.value
+        pot_on_count = self.pot_on_count.value
+        if pot_off_count != self.handled_pot_off:
+            logger.info("Pot is removed - Delta: %.1f", delta)
             self.has_pot = False
             if self.removed_pot_callback is not None:
                 self.removed_pot_callback()
-            self.signals["POT_OFF"].set()
+            self.handled_pot_off = pot_off_count
 
-        elif not self.signals["POT_ON"].is_set():
-            print(f"Pot is back - Delta: {delta:.1f}")
+        elif pot_on_count != self.handled_pot_on:
+            logger.info("Pot is back - Delta: %.1f", delta)
             self.has_pot = True
             self.update_mug_value = (
                 True  # Update mug weight value with next stable reading
             )
-            self.signals["POT_ON"].set()
+            self.handled_pot_on = pot_on_count
 
         if self.has_pot:
-            std = statistics.stdev(readings)
-            if (std is not None) and (std <= 5):
+            new_stable_value = self.stats[2 * last]
+            std = sample_stdev(min(n, size), self.stats[2 * last + 1])
+            if std <= 5:
                 # We have a stable reading
-                new_stable_value = statistics.mean(readings)
                 if self.update_mug_value:
                     self.mug_value = self.stable_value - new_stable_value
-                    print(f"Mug {self.mug_value}")
+                    logger.info("Mug %s", self.mug_value)
                     if (self.mug_value > 15) and (self.mug_value < 500):
                         # Between 15g and 500G, we consider it's a mug
                         if self.served_mug_callback is not None:
@@ -156,15 +339,13 @@ class Scale:
         """Stop the sensor reading process and release resources."""
         self.stop_event.set()
         if self.pw is not None:
-            print("Scale process terminate")
-            self.pw.terminate()
-            print("Scale process join")
-            self.pw.join()
-        print("Manager shutdown")
-        self.manager.shutdown()
-        print("HX711 shutdown")
-        self.hx.powerDown()
-        self.hx.disconnect()
+            # The process shuts the HX711 down once its current reading is done
+            logger.debug("Joining the scale process")
+            self.pw.join(timeout=1)
+            if self.pw.is_alive():
+                logger.debug("Terminating the scale process")
+                self.pw.terminate()
+                self.pw.join()
 
     def get_last_mug_value(self) -> float:
         """Get the weight of the last served mug."""
@@ -1,5 +1,6 @@
 #! /home/dietpi/coffee/.venv//bin/activate
 
+import logging
 import signal
 from threading import Event
 
@@ -9,6 +10,8 @@ from coffee.io.multiplex import Multiplex
 from coffee.io.scale import Scale
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     app = LCDApp()
 
     encoder = Encoder(
@@ -32,6 +35,8 @@ if __name__ == "__main__":
     def quit(signo, _frame):
         print(f"Interrupted by {signo}, shutting down")
         exit.set()
+        # Do not wait for the loop to tick
+        scale.wake()
 
     signal.signal(signal.SIGTERM, quit)
     signal.signal(signal.SIGINT, quit)
@@ -43,7 +48,10 @@ if __name__ == "__main__":
             scale.read()
             multiplex.mcp.digital_read_all()
             app.check_timeout()
-            exit.wait(0.5)
+            # Pot events and shutdown signals wake the loop up right away, the
+            # UI inputs being callback-driven. Otherwise it ticks to follow the
+            # stable weight and the page timeout.
+            scale.wait_for_event(0.5)
     except Exception as e:
         raise e
     finally:
@@ -55,3 +63,5 @@ if __name__ == "__main__":
         encoder.cleanup()
         print("LCD cleanup")
         app.lcd.turn_off()
+        print("Database cleanup")
+        app.db.close()